@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the detection server
+Measures cold import time in fresh interpreters and time to first response.
+
+Most of the import cost is the standard library's http.server (and the
+email/html/mimetypes modules it pulls in), which dd.py needs to serve at
+all, so the output also reports that floor and dd's own share on top of it.
+Only the share above the floor is something dd.py can reduce.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RUNS = 10
+
+
+def cold_import_ms(module):
+    """Time importing `module` in a fresh interpreter, as a forked/autoscaled worker would"""
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    out = subprocess.check_output([sys.executable, "-c", code], cwd=HERE)
+    return float(out.strip())
+
+
+def median_ms(module):
+    return sorted(cold_import_ms(module) for _ in range(RUNS))[RUNS // 2]
+
+
+def first_response_ms():
+    """Time from import to the first served page and the first /detect answer.
+
+    Runs in this process, where urllib has already loaded most of the stdlib,
+    so it shows dd's own setup and first-request cost rather than a cold start.
+    """
+    start = time.perf_counter()
+    sys.path.insert(0, HERE)
+    import dd
+
+    server = dd.ThreadedServer(("127.0.0.1", 0), dd.Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        urllib.request.urlopen(base + "/").read()
+        page = (time.perf_counter() - start) * 1000
+        req = urllib.request.Request(base + "/detect", data=b'{"client_id": "bench"}',
+                                     headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(req).read()
+        detect = (time.perf_counter() - start) * 1000
+    finally:
+        server.shutdown()
+    return page, detect
+
+
+def main():
+    floor = median_ms("http.server")
+    total = median_ms("dd")
+    print(f"import http.server : {floor:.1f} ms (median, stdlib floor)")
+    print(f"import dd          : {total:.1f} ms (median)")
+    print(f"dd on top of floor : {total - floor:.1f} ms")
+    page, detect = first_response_ms()
+    print(f"first GET /        : {page:.1f} ms after import started")
+    print(f"first /detect      : {detect:.1f} ms after import started")
+
+
+if __name__ == "__main__":
+    main()
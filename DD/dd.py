@@ -1,26 +1,63 @@
 #!/usr/bin/env python3
 """
 Drowsy Driving Detection Server
-NO EXTERNAL PACKAGES REQUIRED - Pure Python only
+Pure Python in the default simulation mode; OpenCV and NumPy are only
+needed (and only imported) with DD_MODE=opencv-eyecount
 """
 
 import http.server
+import os
 import socketserver
 import json
 import base64
+import bisect
+import io
+import math
 import random
+import struct
+import sys
 import time
 import threading
+from array import array
+from collections import OrderedDict, deque
 from datetime import datetime
+from urllib.parse import urlparse, parse_qsl
 
 # Configuration
 HOST = "0.0.0.0"
 PORT = 8000
+DETECTION_MODES = ('simulation', 'opencv-eyecount')
+DETECTION_MODE = os.environ.get("DD_MODE", "simulation")
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+EXPORT_PAGE_SIZE = 1000
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'npz': 'application/octet-stream'
+}
+PERCLOS_WINDOW = 150    # frames (~30 s at one frame per 200 ms)
+ALERT_WINDOW = 60       # seconds of alerts counted as "recent"
+ACTIVE_TIMEOUT = 30     # seconds without a frame before a driver drops out
+PERCLOS_MIN_FRAMES = 25 # frames before a driver is ranked by PERCLOS (~5 s)
+MAX_FPS = 5             # frame rate the page sends at
+ALERT_BUCKET_CAP = ALERT_WINDOW * MAX_FPS    # alert counts above this rank as ties
+FLEET_TOP_K = 10
+FRAME_MAX_DISTANCE = int(os.environ.get("DD_FRAME_DISTANCE", 4))      # differing hash bits
+FRAME_MAX_AGE = float(os.environ.get("DD_FRAME_MAX_AGE", 2.0))       # seconds
+FRAME_CACHE_SIZE = 50000    # clients remembered before the oldest is evicted
 
 # Storage
 users = {}
 detection_history = []
 alert_count = 0
+_history_lock = threading.Lock()
+
+# Lazily loaded resources (kept off the import path for fast worker startup)
+_static_cache = {}
+_static_lock = threading.Lock()
+_cv = None
+_cv_error = None
+_cv_lock = threading.Lock()
 
 # Simulated EAR values for demo (since no OpenCV)
 def simulate_ear():
@@ -30,579 +67,359 @@ def simulate_ear():
     variation = random.uniform(-0.08, 0.08)
     return round(max(0.10, min(0.40, base + variation)), 2)
 
-# HTML Frontend - Complete single page
-HTML_PAGE = """<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Drowsy Driving Detection System</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body { 
-            font-family: 'Segoe UI', system-ui, sans-serif;
-            background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%);
-            color: #f8fafc;
-            min-height: 100vh;
-            padding: 20px;
-        }
-        .container { max-width: 1200px; margin: 0 auto; }
-        
-        header { 
-            display: flex; justify-content: space-between; align-items: center; 
-            margin-bottom: 30px; padding: 20px;
-            background: rgba(30, 41, 59, 0.8); border-radius: 16px;
-            border: 1px solid #334155;
-        }
-        .logo { font-size: 28px; font-weight: 700; color: #06b6d4; }
-        .status { 
-            display: flex; align-items: center; gap: 8px;
-            padding: 8px 16px; background: #0f172a;
-            border-radius: 20px; font-size: 14px;
-        }
-        .status-dot { 
-            width: 10px; height: 10px; border-radius: 50%; 
-            background: #ef4444; transition: all 0.3s;
-        }
-        .status-dot.connected { background: #22c55e; box-shadow: 0 0 10px #22c55e; }
-        
-        .grid { display: grid; grid-template-columns: 2fr 1fr; gap: 20px; }
-        @media (max-width: 900px) { .grid { grid-template-columns: 1fr; } }
-        
-        .video-box {
-            position: relative; background: #000;
-            border-radius: 16px; overflow: hidden;
-            border: 2px solid #334155; aspect-ratio: 16/9;
-        }
-        #webcam { 
-            width: 100%; height: 100%; object-fit: cover;
-            transform: scaleX(-1);
-        }
-        .alert-box {
-            position: absolute; inset: 0;
-            display: none; flex-direction: column;
-            align-items: center; justify-content: center;
-            background: rgba(220, 38, 38, 0.95);
-            z-index: 10;
-        }
-        .alert-box.active { display: flex; animation: pulse 0.5s infinite; }
-        @keyframes pulse { 0%, 100% { opacity: 0.9; } 50% { opacity: 1; } }
-        .alert-title { font-size: 60px; font-weight: 900; text-transform: uppercase; }
-        .alert-sub { font-size: 20px; margin-top: 10px; }
-        
-        .controls {
-            position: absolute; bottom: 20px; left: 20px; right: 20px;
-            display: flex; justify-content: space-between; z-index: 5;
-        }
-        button {
-            padding: 12px 24px; border: none; border-radius: 8px;
-            font-size: 14px; font-weight: 600; cursor: pointer;
-            transition: all 0.3s;
-        }
-        .btn-start { background: #06b6d4; color: white; }
-        .btn-start:hover { background: #0891b2; }
-        .btn-stop { background: #ef4444; color: white; }
-        .btn-test { background: #f59e0b; color: white; }
-        
-        .stats-bar {
-            display: grid; grid-template-columns: repeat(4, 1fr);
-            gap: 15px; margin-top: 20px;
-        }
-        .stat-card {
-            background: rgba(30, 41, 59, 0.6);
-            padding: 20px; border-radius: 12px;
-            text-align: center; border: 1px solid #334155;
-        }
-        .stat-label { font-size: 12px; color: #94a3b8; text-transform: uppercase; margin-bottom: 8px; }
-        .stat-value { font-size: 28px; font-weight: 700; color: #06b6d4; }
-        
-        .sidebar { display: flex; flex-direction: column; gap: 20px; }
-        .card {
-            background: rgba(30, 41, 59, 0.6);
-            padding: 20px; border-radius: 16px;
-            border: 1px solid #334155;
-        }
-        .card h3 { color: #06b6d4; margin-bottom: 15px; font-size: 14px; text-transform: uppercase; }
-        
-        .gauge-wrap { text-align: center; margin: 20px 0; }
-        .gauge {
-            width: 150px; height: 150px; margin: 0 auto;
-            position: relative; display: inline-block;
-        }
-        .gauge-bg {
-            fill: none; stroke: #334155; stroke-width: 10;
-        }
-        .gauge-fill {
-            fill: none; stroke: #22c55e; stroke-width: 10;
-            stroke-linecap: round;
-            transform: rotate(-90deg);
-            transform-origin: 50% 50%;
-            transition: all 0.3s;
-        }
-        .gauge-text {
-            position: absolute; inset: 0;
-            display: flex; flex-direction: column;
-            align-items: center; justify-content: center;
-        }
-        .gauge-val { font-size: 36px; font-weight: 800; }
-        .gauge-lbl { font-size: 12px; color: #64748b; }
-        
-        .info-row {
-            display: flex; justify-content: space-between;
-            padding: 10px 0; border-bottom: 1px solid #334155;
-        }
-        .info-row:last-child { border-bottom: none; }
-        .badge {
-            padding: 4px 12px; border-radius: 20px;
-            font-size: 12px; font-weight: 600;
-            background: rgba(34, 197, 94, 0.1); color: #22c55e;
-        }
-        .badge.alert { background: rgba(239, 68, 68, 0.1); color: #ef4444; }
-        
-        input[type="range"] {
-            width: 100%; margin: 10px 0;
-            -webkit-appearance: none; height: 6px;
-            background: #334155; border-radius: 3px; outline: none;
-        }
-        input[type="range"]::-webkit-slider-thumb {
-            -webkit-appearance: none; width: 18px; height: 18px;
-            background: #06b6d4; border-radius: 50%; cursor: pointer;
-        }
-        
-        .event-log {
-            max-height: 200px; overflow-y: auto;
-            font-size: 12px;
-        }
-        .event-item {
-            padding: 8px; margin-bottom: 5px;
-            background: #0f172a; border-radius: 6px;
-            border-left: 3px solid #22c55e;
-        }
-        .event-item.alert { border-left-color: #ef4444; background: rgba(239, 68, 68, 0.1); }
-        
-        .modal {
-            position: fixed; inset: 0;
-            background: rgba(15, 23, 42, 0.98);
-            display: flex; align-items: center; justify-content: center;
-            z-index: 1000;
-        }
-        .modal.hidden { display: none; }
-        .modal-box {
-            background: #1e293b; padding: 40px;
-            border-radius: 20px; width: 90%; max-width: 400px;
-            border: 1px solid #334155;
-        }
-        .modal-box h2 { color: #06b6d4; margin-bottom: 20px; }
-        .input-group { margin-bottom: 15px; }
-        .input-group label { display: block; margin-bottom: 5px; color: #94a3b8; font-size: 14px; }
-        .input-group input {
-            width: 100%; padding: 12px; border: 1px solid #334155;
-            background: #0f172a; color: white; border-radius: 8px;
-        }
-        .btn-block { width: 100%; margin-top: 10px; }
-        .text-center { text-align: center; margin-top: 15px; color: #64748b; font-size: 14px; }
-        .text-center a { color: #06b6d4; text-decoration: none; }
-        .hidden { display: none !important; }
-        
-        .error-toast {
-            position: fixed; top: 20px; right: 20px;
-            background: #ef4444; color: white;
-            padding: 15px 20px; border-radius: 8px;
-            display: none; z-index: 1001;
-        }
-        .error-toast.show { display: block; }
-    </style>
-</head>
-<body>
-    <div id="errorToast" class="error-toast"></div>
-    
-    <div id="authModal" class="modal">
-        <div class="modal-box">
-            <h2 id="authTitle">Welcome Back</h2>
-            <div id="loginForm">
-                <div class="input-group">
-                    <label>Username</label>
-                    <input type="text" id="loginUser" placeholder="Enter username">
-                </div>
-                <div class="input-group">
-                    <label>Password</label>
-                    <input type="password" id="loginPass" placeholder="Enter password">
-                </div>
-                <button class="btn-start btn-block" onclick="login()">Sign In</button>
-                <div class="text-center">New user? <a href="#" onclick="showRegister()">Create account</a></div>
-            </div>
-            <div id="registerForm" class="hidden">
-                <div class="input-group">
-                    <label>Username</label>
-                    <input type="text" id="regUser" placeholder="Choose username">
-                </div>
-                <div class="input-group">
-                    <label>Email</label>
-                    <input type="email" id="regEmail" placeholder="Enter email">
-                </div>
-                <div class="input-group">
-                    <label>Password</label>
-                    <input type="password" id="regPass" placeholder="Create password">
-                </div>
-                <button class="btn-start btn-block" onclick="register()">Create Account</button>
-                <div class="text-center">Have account? <a href="#" onclick="showLogin()">Sign in</a></div>
-            </div>
-        </div>
-    </div>
-
-    <div class="container">
-        <header>
-            <div class="logo">🚗 SafeDrive AI</div>
-            <div class="status">
-                <div id="connDot" class="status-dot"></div>
-                <span id="connText">Connecting...</span>
-            </div>
-        </header>
-
-        <div class="grid">
-            <div>
-                <div class="video-box">
-                    <video id="webcam" autoplay playsinline></video>
-                    <div id="alertBox" class="alert-box">
-                        <div class="alert-title">WAKE UP!</div>
-                        <div class="alert-sub">Drowsiness Detected - Pull Over Safely</div>
-                    </div>
-                    <div class="controls">
-                        <button id="toggleBtn" class="btn-start" onclick="toggleDetection()">▶ Start Detection</button>
-                        <button class="btn-test" onclick="testAlert()">⚠ Test Alert</button>
-                    </div>
-                </div>
-                
-                <div class="stats-bar">
-                    <div class="stat-card">
-                        <div class="stat-label">Session Time</div>
-                        <div id="sessionTime" class="stat-value">00:00</div>
-                    </div>
-                    <div class="stat-card">
-                        <div class="stat-label">Frames</div>
-                        <div id="frameCount" class="stat-value">0</div>
-                    </div>
-                    <div class="stat-card">
-                        <div class="stat-label">Alerts</div>
-                        <div id="alertCount" class="stat-value" style="color: #ef4444;">0</div>
-                    </div>
-                    <div class="stat-card">
-                        <div class="stat-label">Mode</div>
-                        <div class="stat-value" style="font-size: 14px; margin-top: 8px;">SIMULATION</div>
-                    </div>
-                </div>
-            </div>
-
-            <div class="sidebar">
-                <div class="card">
-                    <h3>👁 Eye Aspect Ratio</h3>
-                    <div class="gauge-wrap">
-                        <div class="gauge">
-                            <svg width="150" height="150" viewBox="0 0 100 100">
-                                <circle class="gauge-bg" cx="50" cy="50" r="40"/>
-                                <circle id="gaugeFill" class="gauge-fill" cx="50" cy="50" r="40" 
-                                    stroke-dasharray="251.2" stroke-dashoffset="62.8"/>
-                            </svg>
-                            <div class="gauge-text">
-                                <div id="earValue" class="gauge-val">0.30</div>
-                                <div class="gauge-lbl">EAR</div>
-                            </div>
-                        </div>
-                    </div>
-                    <div class="info-row">
-                        <span>Eye Status</span>
-                        <span id="eyeStatus" class="badge">OPEN</span>
-                    </div>
-                </div>
-
-                <div class="card">
-                    <h3>⚙️ Settings</h3>
-                    <label style="font-size: 13px; color: #94a3b8;">Drowsiness Threshold</label>
-                    <input type="range" id="threshold" min="0.10" max="0.30" step="0.01" value="0.20" 
-                        oninput="updateThreshold(this.value)">
-                    <div style="display: flex; justify-content: space-between; font-size: 12px; color: #64748b; margin-top: 5px;">
-                        <span>Strict (0.10)</span>
-                        <span id="threshDisplay">0.20</span>
-                        <span>Lenient (0.30)</span>
-                    </div>
-                </div>
-
-                <div class="card">
-                    <h3>📋 Event Log</h3>
-                    <div id="eventLog" class="event-log">
-                        <div class="event-item">System initialized</div>
-                    </div>
-                </div>
-            </div>
-        </div>
-    </div>
-
-    <script>
-        // Auto-detect server URL
-        const API_URL = window.location.origin;
-        
-        // State
-        let isRunning = false;
-        let stream = null;
-        let frameCount = 0;
-        let alertCount = 0;
-        let sessionStart = null;
-        let earThreshold = 0.20;
-        let timerInterval = null;
-        let frameInterval = null;
-        let clientId = null;
-        
-        const video = document.getElementById('webcam');
-        const alertBox = document.getElementById('alertBox');
-        const toggleBtn = document.getElementById('toggleBtn');
-        const connDot = document.getElementById('connDot');
-        const connText = document.getElementById('connText');
-        
-        // Check server on load
-        async function checkServer() {
-            try {
-                const res = await fetch(`${API_URL}/ping`);
-                if (res.ok) {
-                    connDot.classList.add('connected');
-                    connText.textContent = 'Connected';
-                    return true;
-                }
-            } catch (e) {
-                showError('Server not found. Make sure server is running on port 8000');
-            }
-            return false;
-        }
-        
-        function showError(msg) {
-            const toast = document.getElementById('errorToast');
-            toast.textContent = msg;
-            toast.classList.add('show');
-            setTimeout(() => toast.classList.remove('show'), 4000);
-        }
-        
-        // Auth UI
-        function showRegister() {
-            document.getElementById('loginForm').classList.add('hidden');
-            document.getElementById('registerForm').classList.remove('hidden');
-            document.getElementById('authTitle').textContent = 'Create Account';
-        }
-        function showLogin() {
-            document.getElementById('registerForm').classList.add('hidden');
-            document.getElementById('loginForm').classList.remove('hidden');
-            document.getElementById('authTitle').textContent = 'Welcome Back';
-        }
-        
-        // API calls
-        async function postJSON(endpoint, data) {
-            try {
-                const res = await fetch(`${API_URL}${endpoint}`, {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify(data)
-                });
-                return await res.json();
-            } catch (e) {
-                showError('Connection failed');
-                return {error: 'Connection failed'};
-            }
-        }
-        
-        async function register() {
-            const res = await postJSON('/register', {
-                username: document.getElementById('regUser').value,
-                email: document.getElementById('regEmail').value,
-                password: document.getElementById('regPass').value
-            });
-            if (res.error) showError(res.error);
-            else {
-                alert('Account created! Please login.');
-                showLogin();
-            }
-        }
-        
-        async function login() {
-            const res = await postJSON('/login', {
-                username: document.getElementById('loginUser').value,
-                password: document.getElementById('loginPass').value
-            });
-            if (res.error) showError(res.error);
-            else {
-                clientId = res.client_id;
-                document.getElementById('authModal').classList.add('hidden');
-                startCamera();
-            }
-        }
-        
-        async function startCamera() {
-            if (!(await checkServer())) return;
-            
-            try {
-                stream = await navigator.mediaDevices.getUserMedia({video: true});
-                video.srcObject = stream;
-                addEvent('Camera started - ready for detection');
-            } catch (e) {
-                showError('Camera access denied');
-            }
-        }
-        
-        // Detection control
-        async function toggleDetection() {
-            if (isRunning) {
-                stopDetection();
-            } else {
-                startDetection();
-            }
-        }
-        
-        function startDetection() {
-            if (!stream) {
-                showError('Start camera first');
-                return;
-            }
-            
-            isRunning = true;
-            toggleBtn.textContent = '⏸ Stop Detection';
-            toggleBtn.className = 'btn-stop';
-            
-            sessionStart = Date.now();
-            updateTimer();
-            timerInterval = setInterval(updateTimer, 1000);
-            
-            // Start sending frames (5 FPS to avoid overload)
-            processFrame();
-            frameInterval = setInterval(processFrame, 200);
-            
-            addEvent('Detection started');
-        }
-        
-        function stopDetection() {
-            isRunning = false;
-            toggleBtn.textContent = '▶ Start Detection';
-            toggleBtn.className = 'btn-start';
-            
-            clearInterval(timerInterval);
-            clearInterval(frameInterval);
-            alertBox.classList.remove('active');
-            
-            addEvent('Detection stopped');
-        }
-        
-        async function processFrame() {
-            if (!isRunning) return;
-            
-            // Capture frame
-            const canvas = document.createElement('canvas');
-            canvas.width = 320;
-            canvas.height = 240;
-            const ctx = canvas.getContext('2d');
-            ctx.drawImage(video, 0, 0, 320, 240);
-            
-            const imageData = canvas.toDataURL('image/jpeg', 0.7);
-            
-            // Send to server
-            const result = await postJSON('/detect', {
-                client_id: clientId,
-                image: imageData,
-                threshold: earThreshold
-            });
-            
-            if (!result.error) {
-                updateDisplay(result.ear, result.is_drowsy);
-                frameCount++;
-                document.getElementById('frameCount').textContent = frameCount;
-                
-                if (result.is_drowsy) {
-                    triggerAlert();
-                }
-            }
-        }
-        
-        function updateDisplay(ear, isDrowsy) {
-            document.getElementById('earValue').textContent = ear.toFixed(2);
-            
-            const fill = document.getElementById('gaugeFill');
-            const offset = 251.2 - ((ear - 0.1) / 0.3 * 251.2);
-            fill.style.strokeDashoffset = Math.max(0, offset);
-            
-            const status = document.getElementById('eyeStatus');
-            
-            if (isDrowsy || ear < earThreshold) {
-                fill.style.stroke = '#ef4444';
-                status.textContent = 'CLOSED';
-                status.className = 'badge alert';
-            } else {
-                fill.style.stroke = '#22c55e';
-                status.textContent = 'OPEN';
-                status.className = 'badge';
-                alertBox.classList.remove('active');
+# Frontend assets - read from STATIC_DIR on first request, then served from memory
+def load_static(name):
+    """Return the bytes of a static asset, reading it only once"""
+    data = _static_cache.get(name)
+    if data is None:
+        with _static_lock:
+            data = _static_cache.get(name)
+            if data is None:
+                with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+                    data = f.read()
+                _static_cache[name] = data
+    return data
+
+# OpenCV/NumPy are only imported the first time a non-simulation mode is used
+def load_cv():
+    """Import OpenCV and NumPy and build the eye detector on first use.
+
+    A failed import is remembered and re-raised, not retried on every frame.
+    """
+    global _cv, _cv_error
+    if _cv is None:
+        with _cv_lock:
+            if _cv_error is not None:
+                raise ImportError(_cv_error)
+            if _cv is None:
+                try:
+                    import cv2
+                    import numpy
+                except ImportError as e:
+                    _cv_error = str(e)
+                    raise
+                cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+                _cv = (cv2, numpy, cascade)
+    return _cv
+
+def decode_frame(image):
+    """Decode a base64 (or data URL) JPEG frame to a grayscale array.
+
+    Raises ValueError for anything that is not a decodable image.
+    """
+    if not isinstance(image, str):
+        raise ValueError("Invalid image")
+    cv2, np, _ = load_cv()
+    if ',' in image:
+        image = image.split(',', 1)[1]
+    raw = base64.b64decode(image)
+    if not raw:
+        raise ValueError("Invalid image")
+    try:
+        gray = cv2.imdecode(np.frombuffer(raw, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    except cv2.error:
+        gray = None
+    if gray is None:
+        raise ValueError("Invalid image")
+    return gray
+
+def frame_signature(gray):
+    """64-bit difference hash of a 9x8 downsample of the frame"""
+    cv2, np, _ = load_cv()
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), 'big')
+
+# Placeholder for real detection: this is NOT an eye aspect ratio. It maps the
+# number of Haar-cascade eye boxes to an EAR-like score, so a frame where the
+# cascade misses both eyes (glance at a mirror, dim cabin) reads as closed.
+# Swap in a landmark-based EAR before relying on it for alerts.
+def eyecount_ear(gray):
+    """EAR-like placeholder score: 0.10 no eyes found, 0.20 one eye, 0.30 both"""
+    _, _, cascade = load_cv()
+    eyes = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5)
+    return round(0.10 + 0.10 * min(len(eyes), 2), 2)
+
+# History export - records are streamed page by page so memory stays flat
+def record_detection(client_id, ear, is_drowsy):
+    """Append a detection to history and return its ts.
+
+    The timestamp is taken and appended under one lock, and clamped so it
+    never goes backwards if the wall clock steps, keeping history in ts order.
+    """
+    with _history_lock:
+        now = time.time()
+        if detection_history and now < detection_history[-1]['ts']:
+            now = detection_history[-1]['ts']
+        detection_history.append({
+            "client_id": client_id,
+            "ts": now,
+            "time": datetime.fromtimestamp(now).isoformat(),
+            "ear": ear,
+            "is_drowsy": is_drowsy
+        })
+    return now
+
+class _TsView:
+    """History timestamps as a sequence, so bisect needs no key= (3.10+ only)"""
+    def __init__(self, records):
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        return self.records[i]['ts']
+
+def history_pages(client_id=None, start=None, end=None, stop=None, page_size=EXPORT_PAGE_SIZE):
+    """Yield pages of detection_history records with start <= ts < end"""
+    history = detection_history
+    if stop is None:
+        stop = len(history)
+    # record_detection keeps history in ts order, so the range start can be
+    # bisected and the scan can stop at the first record past the end; each
+    # page is still filtered on both bounds
+    i = 0 if start is None else bisect.bisect_left(_TsView(history), start, 0, stop)
+    while i < stop:
+        page = history[i:min(i + page_size, stop)]
+        i += len(page)
+        if end is not None and page[-1]['ts'] >= end:
+            i = stop
+        page = [r for r in page
+                if (start is None or r['ts'] >= start)
+                and (end is None or r['ts'] < end)
+                and (client_id is None or r['client_id'] == client_id)]
+        if page:
+            yield page
+
+def ndjson_chunks(pages):
+    """Encode pages as newline-delimited JSON"""
+    for page in pages:
+        yield ''.join(json.dumps(r) + '\n' for r in page).encode()
+
+def csv_chunks(pages):
+    """Encode pages as CSV with a header row"""
+    import csv
+    fields = ['client_id', 'time', 'ts', 'ear', 'is_drowsy']
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for page in pages:
+        writer.writerows(page)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+def _pack_floats(values):
+    """Pack floats as little-endian float64"""
+    data = array('d', values)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+# One .npy member per column: (name, dtype descr, packer)
+NPZ_COLUMNS = [
+    ('ts', '<f8', lambda page: _pack_floats(r['ts'] for r in page)),
+    ('ear', '<f8', lambda page: _pack_floats(r['ear'] for r in page)),
+    ('is_drowsy', '|b1', lambda page: bytes(bool(r['is_drowsy']) for r in page))
+]
+
+def npy_header(descr, count):
+    """Build a .npy v1.0 header for a 1-D array of `count` items"""
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, count)
+    header += ' ' * (-(10 + len(header) + 1) % 64) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+class _ChunkBuffer:
+    """Write-only file object that collects bytes until drained"""
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def npz_chunks(pages, count):
+    """Encode history as an uncompressed .npz, one column at a time.
+
+    `pages` is called once per column, so each record is read again rather
+    than held in memory.
+    """
+    import zipfile
+    out = _ChunkBuffer()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_STORED) as zf:
+        for name, descr, pack in NPZ_COLUMNS:
+            with zf.open(name + '.npy', 'w', force_zip64=True) as member:
+                member.write(npy_header(descr, count))
+                for page in pages():
+                    member.write(pack(page))
+                    yield out.drain()
+            yield out.drain()
+    yield out.drain()
+
+# Fleet summary - drivers are kept in score buckets that are updated on every
+# frame, so ranking the top K never scans every client
+class FleetStats:
+    """Incrementally maintained cross-driver view of PERCLOS and alerts"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = OrderedDict()    # client_id -> state, least recently seen first
+        self.perclos_buckets = [set() for _ in range(101)]    # indexed by PERCLOS %
+        self.alert_buckets = [set()]    # indexed by recent alerts, capped at ALERT_BUCKET_CAP
+        self.alert_times = deque()      # (time, client_id, state) of every recent alert
+        self.last_update = 0.0
+
+    def update(self, client_id, is_drowsy, now):
+        with self.lock:
+            # Alert expiry pops from the front of alert_times, so keep it in order
+            now = self.last_update = max(now, self.last_update)
+            self._expire(now)
+            state = self.clients.get(client_id)
+            if state is None:
+                state = {'frames': deque(), 'closed': 0, 'alerts': 0}
+                self.clients[client_id] = state
+            else:
+                self._unindex(client_id, state)
+                self.clients.move_to_end(client_id)
+            state['last_seen'] = now
+
+            frames = state['frames']
+            frames.append(is_drowsy)
+            state['closed'] += is_drowsy
+            if len(frames) > PERCLOS_WINDOW:
+                state['closed'] -= frames.popleft()
+
+            if is_drowsy:
+                state['alerts'] += 1
+                self.alert_times.append((now, client_id, state))
+            self._index(client_id, state)
+
+    def summary(self, k, by, now):
+        with self.lock:
+            self._expire(now)
+            buckets = self.perclos_buckets if by == 'perclos' else self.alert_buckets
+            top = []
+            for bucket in reversed(buckets):
+                for client_id in bucket:
+                    if len(top) == k:
+                        break
+                    state = self.clients[client_id]
+                    top.append({
+                        "client_id": client_id,
+                        "perclos": round(state['closed'] / len(state['frames']), 3),
+                        "frames": len(state['frames']),
+                        "recent_alerts": state['alerts']
+                    })
+                if len(top) == k:
+                    break
+            return {
+                "active_drivers": len(self.clients),
+                "alerts_per_minute": round(len(self.alert_times) * 60 / ALERT_WINDOW, 2),
+                "ranked_by": by,
+                "top": top
             }
+
+    def _index(self, client_id, state):
+        # Drivers with only a few frames are left out of the PERCLOS ranking,
+        # otherwise a single closed-eye frame would rank as 100%
+        if len(state['frames']) >= PERCLOS_MIN_FRAMES:
+            state['perclos_pct'] = round(100 * state['closed'] / len(state['frames']))
+            self.perclos_buckets[state['perclos_pct']].add(client_id)
+        else:
+            state['perclos_pct'] = None
+        state['alert_bucket'] = min(state['alerts'], ALERT_BUCKET_CAP)
+        while len(self.alert_buckets) <= state['alert_bucket']:
+            self.alert_buckets.append(set())
+        self.alert_buckets[state['alert_bucket']].add(client_id)
+
+    def _unindex(self, client_id, state):
+        if state['perclos_pct'] is not None:
+            self.perclos_buckets[state['perclos_pct']].discard(client_id)
+        self.alert_buckets[state['alert_bucket']].discard(client_id)
+        while len(self.alert_buckets) > 1 and not self.alert_buckets[-1]:
+            self.alert_buckets.pop()
+
+    def _expire(self, now):
+        """Drop idle drivers and alerts older than the window (amortised O(1))"""
+        while self.clients:
+            client_id, state = next(iter(self.clients.items()))
+            if state['last_seen'] > now - ACTIVE_TIMEOUT:
+                break
+            self.clients.popitem(last=False)
+            self._unindex(client_id, state)
+        while self.alert_times and self.alert_times[0][0] <= now - ALERT_WINDOW:
+            _, client_id, state = self.alert_times.popleft()
+            state['alerts'] -= 1
+            # Re-bucket only if the driver is still active with the same state
+            if self.clients.get(client_id) is state:
+                self._unindex(client_id, state)
+                self._index(client_id, state)
+
+fleet = FleetStats()
+
+# Frame cache - a steady driver sends near-identical frames, so the EAR of the
+# last analysed frame is reused while new frames stay within FRAME_MAX_DISTANCE
+class FrameCache:
+    """Per-client signature of the last analysed frame, its EAR and hit stats"""
+    def __init__(self, max_distance=FRAME_MAX_DISTANCE, max_age=FRAME_MAX_AGE, size=FRAME_CACHE_SIZE):
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # client_id -> entry, least recently used first
+
+    def lookup(self, client_id, signature, now):
+        """Return the cached EAR if the frame is a near duplicate, else None"""
+        with self.lock:
+            entry = self.entries.get(client_id)
+            if entry is None:
+                return None
+            self.entries.move_to_end(client_id)
+            # Compare against the analysed frame, not the last hit, so slow drift
+            # still forces a fresh analysis
+            if (now - entry['time'] <= self.max_age
+                    and bin(entry['signature'] ^ signature).count('1') <= self.max_distance):
+                entry['hits'] += 1
+                return entry['ear']
+            entry['misses'] += 1
+            return None
+
+    def store(self, client_id, signature, ear, now):
+        with self.lock:
+            entry = self.entries.get(client_id)
+            if entry is None:
+                entry = {'hits': 0, 'misses': 1}
+                self.entries[client_id] = entry
+                if len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+            entry.update(signature=signature, ear=ear, time=now)
+
+    def stats(self, client_id=None):
+        with self.lock:
+            if client_id is not None:
+                entry = self.entries.get(client_id)
+                entries = [entry] if entry else []
+            else:
+                entries = list(self.entries.values())
+            hits = sum(e['hits'] for e in entries)
+            misses = sum(e['misses'] for e in entries)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0
         }
-        
-        function triggerAlert() {
-            if (alertBox.classList.contains('active')) return;
-            
-            alertBox.classList.add('active');
-            alertCount++;
-            document.getElementById('alertCount').textContent = alertCount;
-            addEvent('⚠️ DROWSINESS DETECTED!', true);
-            
-            // Play alert sound
-            try {
-                const audioCtx = new (window.AudioContext || window.webkitAudioContext)();
-                const oscillator = audioCtx.createOscillator();
-                const gainNode = audioCtx.createGain();
-                
-                oscillator.connect(gainNode);
-                gainNode.connect(audioCtx.destination);
-                
-                oscillator.frequency.value = 800;
-                oscillator.type = 'square';
-                gainNode.gain.setValueAtTime(0.3, audioCtx.currentTime);
-                gainNode.gain.exponentialRampToValueAtTime(0.01, audioCtx.currentTime + 0.5);
-                
-                oscillator.start();
-                oscillator.stop(audioCtx.currentTime + 0.5);
-            } catch(e) {}
-            
-            // Auto dismiss
-            setTimeout(() => {
-                alertBox.classList.remove('active');
-            }, 3000);
-        }
-        
-        function testAlert() {
-            triggerAlert();
-            addEvent('Test alert triggered');
-        }
-        
-        function updateThreshold(val) {
-            earThreshold = parseFloat(val);
-            document.getElementById('threshDisplay').textContent = earThreshold.toFixed(2);
-        }
-        
-        function updateTimer() {
-            if (!sessionStart) return;
-            const elapsed = Math.floor((Date.now() - sessionStart) / 1000);
-            const mins = Math.floor(elapsed / 60).toString().padStart(2, '0');
-            const secs = (elapsed % 60).toString().padStart(2, '0');
-            document.getElementById('sessionTime').textContent = `${mins}:${secs}`;
-        }
-        
-        function addEvent(msg, isAlert = false) {
-            const div = document.createElement('div');
-            div.className = 'event-item' + (isAlert ? ' alert' : '');
-            div.innerHTML = `<strong>${new Date().toLocaleTimeString()}</strong> ${msg}`;
-            const log = document.getElementById('eventLog');
-            log.insertBefore(div, log.firstChild);
-            if (log.children.length > 20) log.lastChild.remove();
-        }
-        
-        // Init
-        checkServer();
-    </script>
-</body>
-</html>
-"""
+
+frame_cache = FrameCache()
 
 
 class Handler(http.server.BaseHTTPRequestHandler):
@@ -610,13 +427,21 @@ class Handler(http.server.BaseHTTPRequestHandler):
         pass  # Suppress logs
     
     def do_GET(self):
-        if self.path in ['/', '/index.html']:
+        url = urlparse(self.path)
+        if url.path in ['/', '/index.html']:
             self.send_response(200)
             self.send_header('Content-type', 'text/html')
             self.end_headers()
-            self.wfile.write(HTML_PAGE.encode())
-        elif self.path == '/ping':
+            self.wfile.write(load_static('index.html'))
+        elif url.path == '/ping':
             self.send_json({"status": "ok"})
+        elif url.path == '/export':
+            self.handle_export(dict(parse_qsl(url.query)))
+        elif url.path == '/fleet/summary':
+            self.handle_fleet_summary(dict(parse_qsl(url.query)))
+        elif url.path == '/cache/stats':
+            query = dict(parse_qsl(url.query))
+            self.send_json(frame_cache.stats(query.get('client_id')))
         else:
             self.send_error(404)
     
@@ -663,26 +488,126 @@ class Handler(http.server.BaseHTTPRequestHandler):
     def handle_detect(self, data):
         global alert_count, detection_history
         
-        # Simulate EAR detection (since no OpenCV)
-        ear = simulate_ear()
+        client_id = data.get('client_id')
+        if client_id is not None and not isinstance(client_id, str):
+            self.send_json({"error": "client_id must be a string"}, 400)
+            return
+        mode = data.get('mode', DETECTION_MODE)
+        if mode not in DETECTION_MODES:
+            self.send_json({"error": "Unknown mode"}, 400)
+            return
+        if mode != DETECTION_MODE:
+            # Clients can't switch a simulation worker onto the OpenCV path
+            self.send_json({"error": "Mode not enabled"}, 400)
+            return
+        reused = False
+        if mode == 'simulation':
+            ear = simulate_ear()
+        elif mode == 'opencv-eyecount':
+            if not data.get('image'):
+                self.send_json({"error": "Image required"}, 400)
+                return
+            try:
+                load_cv()
+            except ImportError as e:
+                self.send_json({"error": f"OpenCV unavailable: {e}"}, 503)
+                return
+            try:
+                gray = decode_frame(data['image'])
+            except ValueError:  # includes binascii.Error from bad base64
+                self.send_json({"error": "Invalid image"}, 400)
+                return
+            if client_id:
+                # Only used for the cache age check; history gets its own ts
+                frame_time = time.time()
+                signature = frame_signature(gray)
+                ear = frame_cache.lookup(client_id, signature, frame_time)
+                reused = ear is not None
+            if not reused:
+                ear = eyecount_ear(gray)
+                if client_id:
+                    frame_cache.store(client_id, signature, ear, frame_time)
         threshold = data.get('threshold', 0.20)
         is_drowsy = ear < threshold
         
         if is_drowsy:
             alert_count += 1
         
-        detection_history.append({
-            "time": datetime.now().isoformat(),
-            "ear": ear,
-            "is_drowsy": is_drowsy
-        })
+        now = record_detection(client_id, ear, is_drowsy)
+        if client_id:
+            fleet.update(client_id, is_drowsy, now)
         
         self.send_json({
             "ear": ear,
             "is_drowsy": is_drowsy,
-            "mode": "simulation"
+            "mode": mode,
+            "reused": reused
         })
-    
+
+    def handle_fleet_summary(self, query):
+        by = query.get('by', 'perclos')
+        if by not in ('perclos', 'alerts'):
+            self.send_json({"error": "by must be perclos or alerts"}, 400)
+            return
+        try:
+            k = int(query.get('k', FLEET_TOP_K))
+        except ValueError:
+            k = 0
+        if k < 1:
+            self.send_json({"error": "Invalid k"}, 400)
+            return
+        summary = fleet.summary(k, by, time.time())
+        summary["alert_count"] = alert_count
+        self.send_json(summary)
+
+    def handle_export(self, query):
+        fmt = query.get('format', 'ndjson')
+        if fmt not in EXPORT_FORMATS:
+            self.send_json({"error": "Unknown format"}, 400)
+            return
+        try:
+            start = float(query['start']) if 'start' in query else None
+            end = float(query['end']) if 'end' in query else None
+            page_size = int(query.get('page_size', EXPORT_PAGE_SIZE))
+        except ValueError:
+            self.send_json({"error": "Invalid start, end or page_size"}, 400)
+            return
+        if page_size < 1 or any(v is not None and not math.isfinite(v) for v in (start, end)):
+            self.send_json({"error": "Invalid start, end or page_size"}, 400)
+            return
+
+        # Snapshot the length so every pass sees the same records
+        client_id = query.get('client_id')
+        stop = len(detection_history)
+        pages = lambda: history_pages(client_id, start, end, stop, page_size)
+        if fmt == 'ndjson':
+            chunks = ndjson_chunks(pages())
+        elif fmt == 'csv':
+            chunks = csv_chunks(pages())
+        else:
+            chunks = npz_chunks(pages, sum(len(p) for p in pages()))
+
+        chunked = self.request_version != 'HTTP/1.0'
+        if chunked:
+            self.protocol_version = 'HTTP/1.1'
+        self.send_response(200)
+        self.send_header('Content-type', EXPORT_FORMATS[fmt])
+        self.send_header('Content-Disposition', f'attachment; filename="history.{fmt}"')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            else:
+                self.wfile.write(chunk)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
     def send_json(self, data, status=200):
         self.send_response(status)
         self.send_header('Content-type', 'application/json')
@@ -703,16 +628,22 @@ class ThreadedServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
 
 
 def main():
+    if DETECTION_MODE not in DETECTION_MODES:
+        sys.exit(f"Unknown DD_MODE {DETECTION_MODE!r}, expected one of: {', '.join(DETECTION_MODES)}")
     print("=" * 60)
     print("DROWSY DRIVING DETECTION SERVER")
-    print("NO INSTALLATION REQUIRED - Pure Python")
     print("=" * 60)
     print(f"Server running at: http://localhost:{PORT}")
     print(f"Open this URL in your browser")
+    print(f"Detection mode: {DETECTION_MODE} (set with DD_MODE)")
     print("=" * 60)
     print("Features:")
     print("- User registration/login")
-    print("- Simulated eye detection (no OpenCV needed)")
+    if DETECTION_MODE == 'simulation':
+        print("- Simulated eye detection (no OpenCV needed)")
+    else:
+        print("- OpenCV eye-count placeholder: scores frames by how many")
+        print("  eyes the cascade finds, not a real EAR")
     print("- Real-time drowsiness alerts")
     print("- Session statistics")
     print("=" * 60)